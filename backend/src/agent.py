@@ -1,8 +1,9 @@
-import asyncio
+import functools
 import json
 import logging
 from dataclasses import dataclass, field
 from pathlib import Path
+from textwrap import dedent
 from typing import Annotated
 
 from dotenv import load_dotenv
@@ -25,36 +26,34 @@ from livekit.plugins import murf, silero, google, deepgram, noise_cancellation
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 from pydantic import Field
 
-from order_state import OrderState, OrderStore
+from order_state import OrderState, OrderStore, OrderWriter, normalize_extras
 
 logger = logging.getLogger("agent")
 
 load_dotenv(".env.local")
 
+# Compact encoder for tool results; the LLM gains nothing from whitespace.
+_dumps = functools.partial(json.dumps, separators=(",", ":"))
+
+# Holds only configuration; each TTS stream gets its own tokenizer stream from it.
+_SENTENCE_TOKENIZER = tokenize.basic.SentenceTokenizer(min_sentence_len=2)
+
 
 @dataclass
 class Userdata:
     order: OrderState = field(default_factory=OrderState)
     order_store: OrderStore = field(default_factory=OrderStore)
+    order_writer: OrderWriter = field(init=False)
     last_saved_path: Path | None = None
     customer_name: str | None = None
 
+    def __post_init__(self) -> None:
+        self.order_writer = OrderWriter(self.order_store)
 
-class Assistant(Agent):
-    def __init__(self, brand_name: str = "Blue Tokai Coffee Roasters") -> None:
-        self.brand_name = brand_name
-        super().__init__(
-            instructions=self._build_instructions(),
-            tools=[
-                self._build_update_order_tool(),
-                self._build_snapshot_tool(),
-                self._build_finalize_tool(),
-            ],
-        )
 
-    def _build_instructions(self) -> str:
-        return f"""
-    You are a knowledgeable and friendly barista at {self.brand_name}, India's finest specialty coffee roasters.
+_INSTRUCTIONS_TEMPLATE = dedent(
+    """
+    You are a knowledgeable and friendly barista at {brand_name}, India's finest specialty coffee roasters.
     - Start the conversation with a warm, professional greeting welcoming the guest to Blue Tokai.
     - Your goal is to craft the perfect coffee experience, taking one drink order at a time.
     - Schema: {{"drinkType": str, "size": str, "milk": str, "extras": [str], "name": str}}.
@@ -65,122 +64,138 @@ class Assistant(Agent):
     - After finalizing, let them know their coffee is being brewed with care and ask if they'd like to order another beverage.
     - Maintain a polite, artisanal, and coffee-passionate tone.
     """
-
-    def _build_update_order_tool(self):
-        @function_tool
-        async def update_order_details(
-            ctx: RunContext[Userdata],
-            drinkType: Annotated[
-                str | None,
-                Field(description="Full name of the requested beverage, e.g., 'Pour Over', 'Cappuccino', 'Cold Brew'."),
-            ] = None,
-            size: Annotated[
-                str | None,
-                Field(description="Size: Regular, Large, or specific ounces."),
-            ] = None,
-            milk: Annotated[
-                str | None,
-                Field(description="Milk choice: Whole, Skim, Oat, Almond, Soy."),
-            ] = None,
-            extras: Annotated[
-                list[str] | None,
-                Field(
-                    description=(
-                        "Add-ons like 'whipped cream', 'hazelnut syrup', 'extra shot', or 'none'."
-                    )
-                ),
-            ] = None,
-            name: Annotated[
-                str | None,
-                Field(description="Customer name for the order."),
-            ] = None,
-        ) -> str:
-            """Update the running order when the guest supplies new information."""
-
-            if extras and any(item.lower() == "none" for item in extras):
-                extras = []
-
-            # Auto-fill name if available in session and not provided
-            if name is None and ctx.userdata.customer_name and not ctx.userdata.order.name:
-                name = ctx.userdata.customer_name
-            
-            if name:
-                ctx.userdata.customer_name = name
-
-            order = ctx.userdata.order
-            changed = order.apply_updates(
-                drink_type=drinkType,
-                size=size,
-                milk=milk,
-                extras=extras,
-                name=name,
+).strip()
+
+
+@functools.cache
+def _render_instructions(brand_name: str) -> str:
+    """Render the barista prompt once per brand for the lifetime of the process."""
+
+    return _INSTRUCTIONS_TEMPLATE.format(brand_name=brand_name)
+
+
+@function_tool
+async def update_order_details(
+    ctx: RunContext[Userdata],
+    drinkType: Annotated[
+        str | None,
+        Field(description="Full name of the requested beverage, e.g., 'Pour Over', 'Cappuccino', 'Cold Brew'."),
+    ] = None,
+    size: Annotated[
+        str | None,
+        Field(description="Size: Regular, Large, or specific ounces."),
+    ] = None,
+    milk: Annotated[
+        str | None,
+        Field(description="Milk choice: Whole, Skim, Oat, Almond, Soy."),
+    ] = None,
+    extras: Annotated[
+        list[str] | None,
+        Field(
+            description=(
+                "Add-ons like 'whipped cream', 'hazelnut syrup', 'extra shot', or 'none'."
             )
+        ),
+    ] = None,
+    name: Annotated[
+        str | None,
+        Field(description="Customer name for the order."),
+    ] = None,
+) -> str:
+    """Update the running order when the guest supplies new information."""
+
+    if extras:
+        extras = normalize_extras(extras)
+
+    # Auto-fill name if available in session and not provided
+    if name is None and ctx.userdata.customer_name and not ctx.userdata.order.name:
+        name = ctx.userdata.customer_name
+
+    if name:
+        ctx.userdata.customer_name = name
+
+    order = ctx.userdata.order
+    changed = order.apply_updates(
+        drink_type=drinkType,
+        size=size,
+        milk=milk,
+        extras=extras,
+        name=name,
+    )
 
-            if not changed:
-                return "No order fields changed."
+    if not changed:
+        return "No order fields changed."
 
-            # Save progress for real-time visualization
-            await asyncio.to_thread(ctx.userdata.order_store.save, order)
+    # Save progress for real-time visualization; rapid updates are coalesced
+    ctx.userdata.order_writer.schedule(order)
 
-            missing = order.missing_fields()
-            if not missing:
-                return f"Order filled: {order.summary()}"
+    missing = order.missing_fields()
+    if not missing:
+        return f"Order filled: {order.summary()}"
 
-            return (
-                "Updated fields: "
-                + ", ".join(changed)
-                + ". Still need: "
-                + ", ".join(missing)
-            )
+    return (
+        "Updated fields: "
+        + ", ".join(changed)
+        + ". Still need: "
+        + ", ".join(missing)
+    )
 
-        return update_order_details
 
-    def _build_snapshot_tool(self):
-        @function_tool
-        async def describe_order_progress(ctx: RunContext[Userdata]) -> str:
-            """Returns the current order payload along with missing fields."""
+@function_tool
+async def describe_order_progress(ctx: RunContext[Userdata]) -> str:
+    """Returns the current order payload along with missing fields."""
+
+    order = ctx.userdata.order
+    snapshot = {
+        "order": order.as_payload(),
+        "missing": order.missing_fields(),
+        "summary": order.summary(),
+        "isComplete": order.is_complete(),
+    }
+    return _dumps(snapshot)
 
-            order = ctx.userdata.order
-            snapshot = {
-                "order": order.as_payload(),
-                "missing": order.missing_fields(),
-                "summary": order.summary(),
-                "isComplete": order.is_complete(),
-            }
-            return json.dumps(snapshot)
 
-        return describe_order_progress
+@function_tool
+async def finalize_order(ctx: RunContext[Userdata]) -> str:
+    """Persists the completed order and resets the in-progress state."""
+
+    order = ctx.userdata.order
+    if not order.is_complete():
+        raise ToolError(
+            "Cannot finalize until all fields are collected: "
+            + ", ".join(order.missing_fields())
+        )
 
-    def _build_finalize_tool(self):
-        @function_tool
-        async def finalize_order(ctx: RunContext[Userdata]) -> str:
-            """Persists the completed order and resets the in-progress state."""
+    save_path = await ctx.userdata.order_writer.flush(order)
+    ctx.userdata.last_saved_path = save_path
+    summary = order.summary()
 
-            order = ctx.userdata.order
-            if not order.is_complete():
-                raise ToolError(
-                    "Cannot finalize until all fields are collected: "
-                    + ", ".join(order.missing_fields())
-                )
+    # Keep the name for the next order
+    current_name = order.name
+    order.reset()
+    if current_name:
+        order.name = current_name
+        ctx.userdata.customer_name = current_name
 
-            save_path = await asyncio.to_thread(ctx.userdata.order_store.save, order)
-            ctx.userdata.last_saved_path = save_path
-            summary = order.summary()
-            
-            # Keep the name for the next order
-            current_name = order.name
-            order.reset()
-            if current_name:
-                order.name = current_name
-                ctx.userdata.customer_name = current_name
+    return f"Saved order to {save_path.name}. Summary: {summary}. Ready for next order (name retained: {current_name})."
 
-            return f"Saved order to {save_path.name}. Summary: {summary}. Ready for next order (name retained: {current_name})."
 
-        return finalize_order
+class Assistant(Agent):
+    def __init__(self, brand_name: str = "Blue Tokai Coffee Roasters") -> None:
+        self.brand_name = brand_name
+        super().__init__(
+            instructions=self._build_instructions(),
+            tools=[update_order_details, describe_order_progress, finalize_order],
+        )
+
+    def _build_instructions(self) -> str:
+        return _render_instructions(self.brand_name)
 
 
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    # Shared by every session in this process; it only writes order files
+    proc.userdata["order_store"] = OrderStore()
 
 
 async def entrypoint(ctx: JobContext):
@@ -205,7 +220,7 @@ async def entrypoint(ctx: JobContext):
         tts=murf.TTS(
                 voice="en-US-matthew", 
                 style="Conversation",
-                tokenizer=tokenize.basic.SentenceTokenizer(min_sentence_len=2),
+                tokenizer=_SENTENCE_TOKENIZER,
                 text_pacing=True
             ),
         # VAD and turn detection are used to determine when the user is speaking and when the agent should respond
@@ -215,7 +230,7 @@ async def entrypoint(ctx: JobContext):
         # allow the LLM to generate a response while waiting for the end of turn
         # See more at https://docs.livekit.io/agents/build/audio/#preemptive-generation
         preemptive_generation=True,
-        userdata=Userdata(),
+        userdata=Userdata(order_store=ctx.proc.userdata["order_store"]),
     )
 
     # To use a realtime model instead of a voice pipeline, use the following session setup instead.
@@ -239,10 +254,16 @@ async def entrypoint(ctx: JobContext):
 
     async def log_usage():
         summary = usage_collector.get_summary()
-        logger.info(f"Usage: {summary}")
+        logger.info("Usage: %s", summary)
 
     ctx.add_shutdown_callback(log_usage)
 
+    async def save_pending_order():
+        # Progress saves are debounced; write the newest snapshot before exit
+        await session.userdata.order_writer.drain()
+
+    ctx.add_shutdown_callback(save_pending_order)
+
     # # Add a virtual avatar to the session, if desired
     # # For other providers, see https://docs.livekit.io/agents/models/avatar/
     # avatar = hedra.AvatarSession(
@@ -1,14 +1,26 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import re
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
+logger = logging.getLogger("order_state")
+
 DEFAULT_ORDER_DIR = Path(__file__).resolve().parents[1] / "KMS" / "logs" / "orders"
-DEFAULT_ORDER_DIR.mkdir(parents=True, exist_ok=True)
+
+# Extras the LLM may pass to mean "no extras"; they are dropped, not stored.
+_NONE_TOKENS = frozenset({"none", "no", "nothing"})
+
+
+def normalize_extras(extras: list[str]) -> list[str]:
+    """Drop "none"-style entries, keeping any real add-ons listed alongside them."""
+
+    return [item for item in extras if item.strip().casefold() not in _NONE_TOKENS]
 
 
 @dataclass
@@ -106,6 +118,9 @@ def _slugify(value: str) -> str:
 class OrderStore:
     base_dir: Path = field(default_factory=lambda: DEFAULT_ORDER_DIR)
 
+    def __post_init__(self) -> None:
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
     def save(self, order: OrderState) -> Path:
         """Persist an order (complete or incomplete) to disk."""
 
@@ -123,4 +138,60 @@ class OrderStore:
              payload["completedAt"] = datetime.now(timezone.utc).isoformat()
 
         file_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
-        return file_path
\ No newline at end of file
+        return file_path
+
+
+@dataclass
+class OrderWriter:
+    """Coalesces in-progress saves so a burst of field updates hits disk once."""
+
+    store: OrderStore
+    delay: float = 0.05
+    _order: OrderState | None = field(default=None, init=False, repr=False)
+    _task: asyncio.Task[None] | None = field(default=None, init=False, repr=False)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock, init=False, repr=False)
+
+    def schedule(self, order: OrderState) -> None:
+        """Queue a progress save; updates within ``delay`` share one write."""
+
+        self._order = order
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._save_pending())
+
+    async def _save_pending(self) -> None:
+        while self._order is not None:
+            await asyncio.sleep(self.delay)
+            async with self._lock:
+                order, self._order = self._order, None
+                if order is not None:
+                    await self._save_progress(order)
+
+    async def _save_progress(self, order: OrderState) -> None:
+        # Runs after the tool has returned, so there is no caller to raise to.
+        try:
+            await asyncio.to_thread(self.store.save, replace(order))
+        except Exception:
+            logger.exception("Failed to save order progress")
+
+    def _cancel_pending(self) -> None:
+        # Only called with the lock held, so the task is never mid-save here.
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def flush(self, order: OrderState) -> Path:
+        """Save ``order`` now, superseding any queued progress save."""
+
+        async with self._lock:
+            self._cancel_pending()
+            self._order = None
+            return await asyncio.to_thread(self.store.save, order)
+
+    async def drain(self) -> None:
+        """Write the queued progress save, if any, without waiting for ``delay``."""
+
+        async with self._lock:
+            self._cancel_pending()
+            order, self._order = self._order, None
+            if order is not None:
+                await self._save_progress(order)
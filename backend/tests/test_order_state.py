@@ -1,9 +1,10 @@
+import asyncio
 import json
 from pathlib import Path
 
 import pytest
 
-from order_state import OrderState, OrderStore
+from order_state import OrderState, OrderStore, OrderWriter, normalize_extras
 
 
 def test_order_state_tracks_missing_fields():
@@ -19,6 +20,12 @@ def test_order_state_tracks_missing_fields():
     assert not order.missing_fields()
 
 
+def test_normalize_extras_drops_only_none_tokens():
+    assert normalize_extras(["vanilla", "none"]) == ["vanilla"]
+    assert normalize_extras(["None "]) == []
+    assert normalize_extras(["no foam"]) == ["no foam"]
+
+
 def test_order_store_writes_json(tmp_path: Path):
     store = OrderStore(base_dir=tmp_path)
     order = OrderState()
@@ -41,3 +48,73 @@ def test_order_store_writes_json(tmp_path: Path):
     with pytest.raises(ValueError):
         incomplete = OrderState()
         store.save(incomplete)
+
+
+def _recording_store(tmp_path: Path, monkeypatch) -> tuple[OrderStore, list[dict]]:
+    store = OrderStore(base_dir=tmp_path)
+    saved: list[dict] = []
+    monkeypatch.setattr(store, "save", lambda order: saved.append(order.as_payload()))
+    return store, saved
+
+
+async def test_order_writer_saves_after_delay(tmp_path: Path, monkeypatch):
+    store, saved = _recording_store(tmp_path, monkeypatch)
+    writer = OrderWriter(store, delay=0.01)
+
+    order = OrderState()
+    order.apply_updates(drink_type="latte")
+    writer.schedule(order)
+    await writer._task
+
+    assert [payload["drinkType"] for payload in saved] == ["latte"]
+
+
+async def test_order_writer_coalesces_updates_within_delay(tmp_path: Path, monkeypatch):
+    store, saved = _recording_store(tmp_path, monkeypatch)
+    writer = OrderWriter(store, delay=60)
+
+    order = OrderState()
+    for update in ({"drink_type": "latte"}, {"size": "large"}, {"milk": "oat"}):
+        order.apply_updates(**update)
+        writer.schedule(order)
+        await asyncio.sleep(0)
+    assert saved == []
+
+    await writer.drain()
+
+    assert len(saved) == 1
+    assert saved[0]["drinkType"] == "latte"
+    assert saved[0]["milk"] == "oat"
+
+
+async def test_order_writer_flush_supersedes_pending_save(tmp_path: Path, monkeypatch):
+    store, saved = _recording_store(tmp_path, monkeypatch)
+    writer = OrderWriter(store, delay=60)
+
+    order = OrderState()
+    order.apply_updates(drink_type="mocha", size="regular", milk="whole", extras=[], name="Ana")
+    writer.schedule(order)
+    await writer.flush(order)
+    order.reset()
+    await writer.drain()
+
+    assert len(saved) == 1
+    assert saved[0]["name"] == "Ana"
+
+
+async def test_order_writer_logs_failed_progress_save(tmp_path: Path, monkeypatch, caplog):
+    store = OrderStore(base_dir=tmp_path)
+
+    def failing_save(order):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "save", failing_save)
+    writer = OrderWriter(store, delay=0.01)
+
+    order = OrderState()
+    order.apply_updates(drink_type="latte")
+    writer.schedule(order)
+    await writer._task
+
+    assert "Failed to save order progress" in caplog.text
+    assert "disk full" in caplog.text